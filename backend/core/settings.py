@@ -87,6 +87,25 @@ DATABASES = {
   }
 }
 
+# Cache
+# Set REDIS_URL (and install the redis package) to share cached results between
+# worker processes; otherwise each process keeps its own. Either way, writes
+# invalidate them for every process
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -187,7 +206,8 @@ CORS_ALLOW_HEADERS = [
 # File upload settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100MB
+# Both handlers hash uploads while receiving them (see files/uploadhandlers.py)
 FILE_UPLOAD_HANDLERS = [
-    'django.core.files.uploadhandler.MemoryFileUploadHandler',
-    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+    'files.uploadhandlers.HashingMemoryFileUploadHandler',
+    'files.uploadhandlers.HashingTemporaryFileUploadHandler',
 ]
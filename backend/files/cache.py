@@ -0,0 +1,31 @@
+"""
+Cached query results that only change when files are added, changed or removed.
+
+Every key includes a version number that each write to the file table bumps,
+so stale entries are simply never read again and expire on their own - no
+pattern deletes needed, which works with any cache backend. The version is
+kept in the database rather than the cache, so it changes for every worker
+process at once even when each has its own local memory cache.
+"""
+from urllib.parse import urlencode
+import hashlib
+from .models import StorageStats
+
+STATS_TIMEOUT = 60  # seconds
+COUNT_TIMEOUT = 60  # seconds
+FILE_TYPES_TIMEOUT = 300  # seconds
+
+
+def files_version():
+    """Return the current version of the file table"""
+    return StorageStats.get().version
+
+
+def versioned_key(prefix, params=None):
+    """
+    Return a cache key for a result of the current file table version.
+    Query parameters are included in any order, so equivalent requests share a key.
+    """
+    query = urlencode(sorted((k, v) for k, values in params.lists() for v in values)) if params else ''
+    digest = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return f"files:{prefix}:{files_version()}:{digest}"
@@ -0,0 +1,192 @@
+import hashlib
+import io
+import mmap
+import os
+
+try:
+    from fastcdc import fastcdc
+except ImportError:  # Content-defined chunking is optional
+    fastcdc = None
+
+try:
+    import xxhash
+except ImportError:  # The fast pre-filter hash is optional
+    xxhash = None
+
+# Files at least this large are hashed through mmap rather than read() copies
+MMAP_THRESHOLD = 1 << 20  # 1MB
+CHUNK_SIZE = 8192 * 1024  # 8MB chunks for file objects without a descriptor
+
+# Content-defined chunk sizes for partial deduplication
+CDC_MIN_SIZE = 4 << 20  # 4MB
+CDC_AVG_SIZE = 8 << 20  # 8MB
+CDC_MAX_SIZE = 16 << 20  # 16MB
+CDC_THRESHOLD = 2 * CDC_MAX_SIZE  # Smaller files are only deduplicated as a whole
+
+
+def best_sha256():
+    """
+    Return a new SHA-256 hash object using the fastest available implementation.
+    hashlib.new() always goes through OpenSSL when Python is linked against it,
+    which picks up SHA-NI (x86) or the ARMv8 crypto extensions automatically.
+    """
+    try:
+        # Content hashes are used for deduplication, not for security
+        return hashlib.new('sha256', usedforsecurity=False)
+    except (TypeError, ValueError):
+        return hashlib.sha256()
+
+
+def _fileno(fileobj):
+    """Return the OS-level descriptor behind a file object, or None if there isn't one."""
+    try:
+        return fileobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        # In-memory uploads (BytesIO) and remote storages have no descriptor
+        return None
+
+
+def _feed_reads(hasher, fileobj):
+    """
+    Feed the rest of a file object into a hash object in CHUNK_SIZE reads.
+    One buffer is filled with readinto() and reused, so no bytes object is
+    allocated per chunk; hash updates this large run without the GIL.
+    """
+    buffer = bytearray(CHUNK_SIZE)
+    try:
+        with memoryview(buffer) as view:
+            while True:
+                read = fileobj.readinto(buffer)
+                if not read:
+                    return
+                with view[:read] as piece:
+                    hasher.update(piece)
+    except (AttributeError, io.UnsupportedOperation):
+        # Some storage backends' files only implement read()
+        pass
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        hasher.update(chunk)
+
+
+def hash_file(fileobj):
+    """
+    Return a SHA-256 hash object fed with the whole content of an open binary file.
+
+    Files backed by a real descriptor are mmap'd, so the kernel pages them in on
+    demand and hashlib digests the mapping in one call without intermediate
+    bytes objects. Small files are read in one shot. Anything without a
+    descriptor (in-memory uploads, remote storages) goes through
+    hashlib.file_digest where available, falling back to chunked reads
+    into a reused buffer.
+    The file position is left at the beginning.
+    """
+    fileobj.seek(0)
+    fd = _fileno(fileobj)
+    size = os.fstat(fd).st_size if fd is not None else None
+
+    if size is not None and size >= MMAP_THRESHOLD:
+        hasher = best_sha256()
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mm)
+    elif size is not None:
+        hasher = best_sha256()
+        hasher.update(fileobj.read())
+    else:
+        hasher = None
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+ runs the read/update loop in C with a reused buffer
+            try:
+                hasher = hashlib.file_digest(fileobj, best_sha256)
+            except ValueError:
+                # file_digest needs readinto() and readable(), which some
+                # storage backends' files don't implement
+                fileobj.seek(0)
+        if hasher is None:
+            hasher = best_sha256()
+            _feed_reads(hasher, fileobj)
+
+    fileobj.seek(0)
+    return hasher
+
+
+def fast_hashing_available():
+    """Return True if the optional xxhash package is installed."""
+    return xxhash is not None
+
+
+def new_fast_hasher():
+    """Return a new xxh3-64 hash object, or None if xxhash isn't installed."""
+    return xxhash.xxh3_64() if xxhash is not None else None
+
+
+def fast_hash_value(hasher):
+    """
+    Return the digest of an xxh3-64 hash object as a signed 64-bit integer,
+    so it fits a BigIntegerField.
+    """
+    value = hasher.intdigest()
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def fast_hash_file(fileobj):
+    """
+    Return the xxh3-64 digest of an open binary file as a signed integer, or
+    None if xxhash isn't installed. It is roughly ten times faster than
+    SHA-256, which makes it a cheap pre-filter for duplicate candidates - a
+    match still has to be confirmed with the SHA-256 hash.
+    The file position is left at the beginning.
+    """
+    if xxhash is None:
+        return None
+    
+    fileobj.seek(0)
+    fd = _fileno(fileobj)
+    size = os.fstat(fd).st_size if fd is not None else None
+    hasher = xxhash.xxh3_64()
+
+    if size is not None and size >= MMAP_THRESHOLD:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mm)
+    else:
+        _feed_reads(hasher, fileobj)
+
+    fileobj.seek(0)
+    return fast_hash_value(hasher)
+
+
+def chunking_available():
+    """Return True if the optional fastcdc package is installed."""
+    return fastcdc is not None
+
+
+def chunk_file(fileobj, hasher=None):
+    """
+    Split a descriptor-backed file into content-defined chunks using FastCDC.
+
+    Returns a list of (SHA-256 hex digest, length) tuples in file order, or
+    None if fastcdc isn't installed or the file has no descriptor to mmap.
+    If a hasher is given, the whole file is fed into it in the same pass.
+    """
+    if fastcdc is None:
+        return None
+    
+    fd = _fileno(fileobj)
+    if fd is None or os.fstat(fd).st_size == 0:
+        return None
+
+    chunks = []
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        for chunk in fastcdc(mm, min_size=CDC_MIN_SIZE, avg_size=CDC_AVG_SIZE, max_size=CDC_MAX_SIZE):
+            with view[chunk.offset:chunk.offset + chunk.length] as piece:
+                chunk_hash = best_sha256()
+                chunk_hash.update(piece)
+                if hasher is not None:
+                    hasher.update(piece)
+            chunks.append((chunk_hash.hexdigest(), chunk.length))
+    return chunks
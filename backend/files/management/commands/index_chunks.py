@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from files.hashing import CDC_THRESHOLD, chunking_available
+from files.models import File
+
+
+class Command(BaseCommand):
+    help = (
+        "Index large original files by content-defined chunks, so content they "
+        "share with other files is detected even when the files aren't identical. "
+        "Files that are already indexed are skipped."
+    )
+
+    def handle(self, *args, **options):
+        if not chunking_available():
+            raise CommandError("Content-defined chunking needs the fastcdc package")
+
+        pending = File.objects.filter(
+            is_duplicate=False, size__gte=CDC_THRESHOLD, chunk_refs__isnull=True
+        ).order_by('uploaded_at')
+
+        indexed = 0
+        for file in pending.iterator(chunk_size=100):
+            try:
+                file.index_chunks()
+                indexed += 1
+            except Exception as e:
+                self.stderr.write(f"Error indexing chunks for {file.original_filename}: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} files; {File.get_chunk_storage_saved()} bytes are shared between files at chunk level"
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0003_auto_20250418_1800'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['is_duplicate', 'size'], name='files_file_is_dupl_e6ed75_idx'),
+        ),
+    ]
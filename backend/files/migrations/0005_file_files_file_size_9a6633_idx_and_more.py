@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0004_file_files_file_is_dupl_e6ed75_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['size', 'is_duplicate'], name='files_file_size_9a6633_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['content_hash', 'is_duplicate'], name='files_file_content_d0f52d_idx'),
+        ),
+    ]
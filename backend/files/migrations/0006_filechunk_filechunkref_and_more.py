@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0005_file_files_file_size_9a6633_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileChunk',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('reference_count', models.PositiveIntegerField(default=0, help_text='Number of files containing this chunk')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FileChunkRef',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='refs', to='files.filechunk')),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunk_refs', to='files.file')),
+            ],
+            options={
+                'ordering': ['file', 'index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filechunkref',
+            constraint=models.UniqueConstraint(fields=('file', 'index'), name='uniq_file_chunk_index'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:42
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def seed_storage_stats(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    StorageStats = apps.get_model('files', 'StorageStats')
+    totals = File.objects.filter(is_duplicate=True).aggregate(
+        bytes_saved=Sum(F('size') - F('actual_size'))
+    )
+    StorageStats.objects.create(pk=1, bytes_saved=totals['bytes_saved'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_filechunk_filechunkref_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bytes_saved', models.BigIntegerField(default=0, help_text='Storage saved through deduplication')),
+            ],
+            options={
+                'verbose_name_plural': 'storage stats',
+            },
+        ),
+        migrations.RunPython(seed_storage_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:43
+
+from django.db import migrations, models
+
+
+def hex_to_raw(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    files = File.objects.exclude(content_hash='').only('id', 'content_hash')
+    for file in files.iterator(chunk_size=2000):
+        try:
+            file.content_hash_raw = bytes.fromhex(file.content_hash)
+        except ValueError:
+            continue
+        file.save(update_fields=['content_hash_raw'])
+
+
+def raw_to_hex(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    files = File.objects.filter(content_hash_raw__isnull=False).only('id', 'content_hash_raw')
+    for file in files.iterator(chunk_size=2000):
+        file.content_hash = bytes(file.content_hash_raw).hex()
+        file.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_storagestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_hash_raw',
+            field=models.BinaryField(blank=True, db_index=True, help_text='Raw SHA-256 digest of the content', max_length=32, null=True),
+        ),
+        migrations.RunPython(hex_to_raw, raw_to_hex),
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_content_d0f52d_idx',
+        ),
+        migrations.RemoveField(
+            model_name='file',
+            name='content_hash',
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['content_hash_raw', 'is_duplicate'], name='files_file_content_a345ff_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:44
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def merge_shared_originals(apps, schema_editor):
+    """
+    Keep the oldest original for each hash and turn any later originals with
+    the same content into its duplicates, so the unique constraint can apply.
+    Their stored files are left in place, so they keep their actual size.
+    """
+    File = apps.get_model('files', 'File')
+    StorageStats = apps.get_model('files', 'StorageStats')
+
+    shared_hashes = File.objects.filter(is_duplicate=False, content_hash_raw__isnull=False).order_by(
+    ).values('content_hash_raw').annotate(c=Count('id')).filter(c__gt=1)
+    if not shared_hashes.exists():
+        return
+
+    for row in shared_hashes:
+        originals = list(File.objects.filter(
+            is_duplicate=False, content_hash_raw=row['content_hash_raw']
+        ).order_by('uploaded_at'))
+        keeper, extras = originals[0], originals[1:]
+        for extra in extras:
+            File.objects.filter(reference_file=extra).update(reference_file=keeper)
+            File.objects.filter(pk=extra.pk).update(
+                is_duplicate=True, reference_file=keeper, reference_count=1
+            )
+        File.objects.filter(pk=keeper.pk).update(
+            reference_count=File.objects.filter(reference_file=keeper).count() + 1
+        )
+
+    totals = File.objects.filter(is_duplicate=True).aggregate(bytes_saved=Sum(F('size') - F('actual_size')))
+    StorageStats.objects.filter(pk=1).update(bytes_saved=totals['bytes_saved'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0008_content_hash_raw'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_shared_originals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='file',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_duplicate', False)), fields=('content_hash_raw',), name='uniq_original_hash'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0009_uniq_original_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='fast_hash',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='xxh3-64 of the content, used to pre-filter duplicate candidates', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_file_fast_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.BigIntegerField()),
+                ('inode', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('content_hash_raw', models.BinaryField(max_length=32)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='hashcache',
+            constraint=models.UniqueConstraint(fields=('inode', 'device', 'mtime_ns', 'size'), name='uniq_hash_cache_key'),
+        ),
+    ]
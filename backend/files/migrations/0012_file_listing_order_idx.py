@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_hashcache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='files_file_uploade_b77ff3_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# icontains compiles to UPPER("original_filename"::text) LIKE UPPER('%term%') on
+# PostgreSQL, which a trigram index on the same expression can serve
+INDEX_NAME = 'files_file_filename_trgm'
+
+
+def create_trigram_index(apps, schema_editor):
+    # Trigram indexes are PostgreSQL-only; other databases keep scanning
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON files_file '
+        f'USING gin ((UPPER(original_filename::text)) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0012_file_listing_order_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:54
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0013_filename_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(django.db.models.functions.text.Upper('file_type'), models.OrderBy(models.F('uploaded_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='files_type_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['is_duplicate', '-uploaded_at', '-id'], name='files_file_is_dupl_187b18_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# iregex compiles to "original_filename"::text ~* 'pattern' on PostgreSQL,
+# which only a trigram index on the column itself can serve
+OLD_INDEX_NAME = 'files_file_filename_trgm'
+INDEX_NAME = 'files_file_filename_col_trgm'
+
+
+def swap_to_column_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {OLD_INDEX_NAME}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON files_file '
+        f'USING gin (original_filename gin_trgm_ops)'
+    )
+
+
+def swap_to_upper_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {OLD_INDEX_NAME} ON files_file '
+        f'USING gin ((UPPER(original_filename::text)) gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0014_filtered_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_to_column_index, swap_to_upper_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:57
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def fill_file_counters(apps, schema_editor):
+    File = apps.get_model('files', 'File')
+    StorageStats = apps.get_model('files', 'StorageStats')
+    totals = File.objects.aggregate(
+        # Ahead of the actual_size alias, which would shadow the column here
+        bytes_saved=Sum(F('size') - F('actual_size'), filter=Q(is_duplicate=True)),
+        unique_files=Count('id', filter=Q(is_duplicate=False)),
+        duplicate_files=Count('id', filter=Q(is_duplicate=True)),
+        total_size=Sum('size'),
+        actual_size=Sum('actual_size')
+    )
+    StorageStats.objects.update_or_create(pk=1, defaults={name: value or 0 for name, value in totals.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0015_filename_trigram_index_column'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storagestats',
+            name='actual_size',
+            field=models.BigIntegerField(default=0, help_text='Storage actually used'),
+        ),
+        migrations.AddField(
+            model_name='storagestats',
+            name='duplicate_files',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storagestats',
+            name='total_size',
+            field=models.BigIntegerField(default=0, help_text='Logical size of all files'),
+        ),
+        migrations.AddField(
+            model_name='storagestats',
+            name='unique_files',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_file_counters, migrations.RunPython.noop),
+    ]
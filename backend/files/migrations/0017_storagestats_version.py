@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-15 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_storagestats_file_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storagestats',
+            name='version',
+            field=models.BigIntegerField(default=0, help_text='Bumped by every write to the file table, for cache invalidation'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 07:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0017_storagestats_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='file',
+            name='files_file_is_dupl_e6ed75_idx',
+        ),
+    ]
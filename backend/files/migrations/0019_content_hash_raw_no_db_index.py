@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-15 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_remove_duplicate_size_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='content_hash_raw',
+            field=models.BinaryField(blank=True, help_text='Raw SHA-256 digest of the content', max_length=32, null=True),
+        ),
+    ]
@@ -1,15 +1,22 @@
-from django.db import models
-from django.db.models.signals import post_delete, post_save
-from django.dispatch import receiver
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Upper
 from django.core.files.storage import default_storage
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 import uuid
 import os
 import hashlib
 import logging
 import tempfile
 import shutil
+import time
 from pathlib import Path
 from django.conf import settings
+from .hashing import (
+    CDC_THRESHOLD, CHUNK_SIZE, best_sha256, chunk_file, chunking_available,
+    fast_hash_file, fast_hashing_available, hash_file,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,10 @@ def file_upload_path(instance, filename):
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join('uploads', filename)
 
+# Storage saved by a file through deduplication as a query expression, so
+# every aggregate sums it the same way (File.storage_saved is the row-level form)
+STORAGE_SAVED = F('size') - F('actual_size')
+
 class File(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to=file_upload_path)
@@ -26,7 +37,8 @@ class File(models.Model):
     file_type = models.CharField(max_length=100)
     size = models.BigIntegerField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    content_hash_raw = models.BinaryField(max_length=32, null=True, blank=True, help_text="Raw SHA-256 digest of the content")
+    fast_hash = models.BigIntegerField(null=True, blank=True, db_index=True, help_text="xxh3-64 of the content, used to pre-filter duplicate candidates")
     reference_file = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
     is_duplicate = models.BooleanField(default=False)
     actual_size = models.BigIntegerField(default=0, help_text="Actual disk space used (differs from size for duplicates)")
@@ -34,67 +46,138 @@ class File(models.Model):
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Same-size pre-check and hash lookup when deduplicating uploads
+            models.Index(fields=['size', 'is_duplicate']),
+            models.Index(fields=['content_hash_raw', 'is_duplicate']),
+            # Keyset pagination seeks on the default listing order
+            models.Index(fields=['-uploaded_at', '-id']),
+            # Filtered listings in the same order; the file_type filter is iexact,
+            # which compares UPPER(file_type)
+            models.Index(Upper('file_type'), F('uploaded_at').desc(), F('id').desc(), name='files_type_recent_idx'),
+            models.Index(fields=['is_duplicate', '-uploaded_at', '-id']),
+        ]
+        constraints = [
+            # Only one original per content; duplicates all reference it
+            models.UniqueConstraint(
+                fields=['content_hash_raw'],
+                condition=models.Q(is_duplicate=False),
+                name='uniq_original_hash'
+            ),
+        ]
     
     def __str__(self):
         return self.original_filename
 
+    @property
+    def content_hash(self):
+        """Hex form of the content hash, as exposed by the API"""
+        return bytes(self.content_hash_raw).hex() if self.content_hash_raw else ''
+
+    @content_hash.setter
+    def content_hash(self, value):
+        self.content_hash_raw = bytes.fromhex(value) if value else None
+
     def calculate_hash(self):
         """
         Calculate and store the SHA-256 hash of the file content.
-        Handles large files efficiently with proper error handling.
+        Stored local files that haven't changed since they were last hashed
+        are answered from the HashCache without reading them again.
         """
-        # Larger chunk size for better performance with big files
-        CHUNK_SIZE = 8192 * 1024  # 8MB chunks for better performance
-        
         try:
-            sha256_hash = hashlib.sha256()
-            
-            # Make sure the file position is at the beginning
-            self.file.seek(0)
-            
-            try:
-                # Try direct file reading first - most efficient approach
-                with self.file.open('rb') as f:
-                    for byte_block in iter(lambda: f.read(CHUNK_SIZE), b""):
-                        sha256_hash.update(byte_block)
-            except (IOError, OSError) as e:
-                # Fallback: If direct file access fails, try downloading to a temp file
-                logger.warning(f"Direct file access failed for {self.original_filename}, using fallback: {str(e)}")
-                
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    temp_path = temp_file.name
-                    try:
-                        # Copy the file to temporary storage
-                        for chunk in self.file.chunks(CHUNK_SIZE):
-                            temp_file.write(chunk)
-                        temp_file.flush()
-                        
-                        # Calculate hash from the temp file
-                        with open(temp_path, 'rb') as f:
-                            for byte_block in iter(lambda: f.read(CHUNK_SIZE), b""):
-                                sha256_hash.update(byte_block)
-                    finally:
-                        # Clean up temp file
-                        try:
-                            Path(temp_path).unlink(missing_ok=True)
-                        except Exception as ex:
-                            logger.error(f"Failed to remove temp file {temp_path}: {str(ex)}")
-            
-            # Reset file position back to the beginning
-            self.file.seek(0)
+            cache_key = self.hash_cache_key()
+            cached = HashCache.lookup([cache_key]).get(cache_key) if cache_key else None
+            if cached:
+                self.content_hash_raw = cached
+                return cached
             
             # Store the calculated hash
-            self.content_hash = sha256_hash.hexdigest()
+            self.content_hash_raw = self.read_content_hash()
+            if cache_key:
+                HashCache.store([(cache_key, self.content_hash_raw)])
             logger.info(f"Calculated hash for {self.original_filename}: {self.content_hash}")
-            return self.content_hash
+            return self.content_hash_raw
             
         except Exception as e:
             logger.error(f"Error calculating hash for {self.original_filename}: {str(e)}")
-            # Return a fallback hash to avoid system failure, but log the error
-            fallback_hash = hashlib.sha256(f"{self.original_filename}_{self.size}_{uuid.uuid4()}".encode()).hexdigest()
-            self.content_hash = fallback_hash
-            logger.warning(f"Using fallback hash for {self.original_filename}: {fallback_hash}")
-            return fallback_hash
+            return self.use_fallback_hash()
+    
+    def use_fallback_hash(self):
+        """Store and return a random hash for a file whose content couldn't be read"""
+        # Return a fallback hash to avoid system failure, but log the error
+        fallback_hash = hashlib.sha256(f"{self.original_filename}_{self.size}_{uuid.uuid4()}".encode()).digest()
+        self.content_hash_raw = fallback_hash
+        logger.warning(f"Using fallback hash for {self.original_filename}: {self.content_hash}")
+        return fallback_hash
+    
+    def read_content_hash(self):
+        """
+        Read the file content and return its raw SHA-256 digest.
+        Handles large files efficiently; raises if the content can't be read.
+        """
+        # Stored files get closed again afterwards; pending uploads stay open for saving
+        was_closed = self.file.closed
+        
+        try:
+            # Try direct file reading first - local files are hashed via mmap
+            self.file.open('rb')
+            try:
+                sha256_hash = hash_file(self.file)
+            finally:
+                if was_closed:
+                    self.file.close()
+        except (IOError, OSError) as e:
+            # Fallback: If direct file access fails, try downloading to a temp file
+            logger.warning(f"Direct file access failed for {self.original_filename}, using fallback: {str(e)}")
+            
+            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+                temp_path = temp_file.name
+                try:
+                    # Copy the file to temporary storage
+                    for chunk in self.file.chunks(CHUNK_SIZE):
+                        temp_file.write(chunk)
+                    temp_file.flush()
+                    
+                    # Calculate hash from the temp file
+                    with open(temp_path, 'rb') as f:
+                        sha256_hash = hash_file(f)
+                finally:
+                    # Clean up temp file
+                    try:
+                        Path(temp_path).unlink(missing_ok=True)
+                    except Exception as ex:
+                        logger.error(f"Failed to remove temp file {temp_path}: {str(ex)}")
+        
+        return sha256_hash.digest()
+    
+    def hash_cache_key(self):
+        """Return the HashCache key of the stored file, or None if it isn't a stored local file"""
+        # Pending uploads aren't in storage yet
+        if self._state.adding or not self.file:
+            return None
+        try:
+            return HashCache.key_for(self.file.path)
+        except (NotImplementedError, OSError, ValueError):
+            # Remote storages have no local path
+            return None
+    
+    def calculate_fast_hash(self):
+        """
+        Calculate and store the xxh3-64 pre-filter hash of the file content.
+        Returns None if xxhash isn't installed or the file can't be read.
+        """
+        try:
+            was_closed = self.file.closed
+            self.file.open('rb')
+            try:
+                self.fast_hash = fast_hash_file(self.file)
+            finally:
+                if was_closed:
+                    self.file.close()
+            return self.fast_hash
+        except Exception as e:
+            logger.error(f"Error calculating fast hash for {self.original_filename}: {str(e)}")
+            return None
     
     def save(self, *args, **kwargs):
         """
@@ -102,102 +185,410 @@ class File(models.Model):
         This ensures files with identical content are properly linked, 
         even if they have different filenames.
         """
-        # Check if this is a new file being added (no ID yet)
-        is_new = not self.pk
+        # Check if this is a new file being added (the UUID primary key is set up front)
+        is_new = self._state.adding
         
-        # For new files, check for duplicates by content
-        if is_new and not self.is_duplicate:
-            try:
-                # Calculate the hash if not already done
-                if not self.content_hash:
-                    self.calculate_hash()
-                
-                # Look for existing file with same hash
-                duplicate_of = self.find_duplicate_by_content(self.content_hash)
-                
-                if duplicate_of:
-                    logger.info(f"Found duplicate content: {self.original_filename} matches {duplicate_of.original_filename}")
+        # The duplicate lookup, the insert and the reference count update share one transaction
+        with transaction.atomic():
+            # For new files, check for duplicates by content
+            if is_new and not self.is_duplicate:
+                try:
+                    # Look for an existing original with the same content (locks its row)
+                    with transaction.atomic():
+                        duplicate_of = self.find_existing_copy()
                     
-                    # This is a duplicate file - set up the reference
-                    self.reference_file = duplicate_of
-                    self.is_duplicate = True
-                    self.actual_size = 0  # No additional storage used
-                    
-                    # Add detailed log for debugging
-                    logger.debug(f"Duplicate details - New file: {self.original_filename}, " 
-                                f"Original: {duplicate_of.original_filename}, "
-                                f"Content hash: {self.content_hash}")
-                else:
-                    # This is a new unique file
+                    if duplicate_of:
+                        logger.info(f"Found duplicate content: {self.original_filename} matches {duplicate_of.original_filename}")
+                        
+                        # This is a duplicate file - set up the reference
+                        self.link_to_original(duplicate_of)
+                        
+                        # Add detailed log for debugging
+                        logger.debug(f"Duplicate details - New file: {self.original_filename}, " 
+                                    f"Original: {duplicate_of.original_filename}, "
+                                    f"Content hash: {self.content_hash}")
+                    else:
+                        # This is a new unique file
+                        self.is_duplicate = False
+                        self.actual_size = self.size
+                        self.reference_file = None
+                        logger.info(f"New unique file: {self.original_filename} with hash {self.content_hash}")
+                
+                except Exception as e:
+                    logger.error(f"Error during duplication check: {str(e)}")
+                    # Fallback to conservative approach
                     self.is_duplicate = False
                     self.actual_size = self.size
                     self.reference_file = None
-                    logger.info(f"New unique file: {self.original_filename} with hash {self.content_hash}")
             
-            except Exception as e:
-                logger.error(f"Error during duplication check: {str(e)}")
-                # Fallback to conservative approach
-                self.is_duplicate = False
-                self.actual_size = self.size
-                self.reference_file = None
-        
-        # Continue with the normal save
-        super().save(*args, **kwargs)
+            # Continue with the normal save
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+            except IntegrityError:
+                # Only one original may exist per hash - if a concurrent upload of
+                # the same content got there first, store this one as its duplicate
+                duplicate_of = None
+                if is_new and not self.is_duplicate:
+                    duplicate_of = self.find_duplicate_by_content(self.content_hash_raw, for_update=True)
+                if not duplicate_of:
+                    raise
+                    
+                logger.info(f"Concurrent duplicate: {self.original_filename} matches {duplicate_of.original_filename}")
+                # Remove the copy stored by the failed insert
+                self.file.delete(save=False)
+                self.link_to_original(duplicate_of)
+                super().save(*args, **kwargs)
+            
+            # Count the new reference on the original with a single atomic UPDATE
+            if is_new and self.is_duplicate and self.reference_file_id:
+                self.__class__.objects.filter(pk=self.reference_file_id).update(
+                    reference_count=F('reference_count') + 1
+                )
+                logger.info(f"Incremented reference count for {self.reference_file_id}")
+            # Counts new files and bumps the version, which invalidates cached results
+            StorageStats.adjust(**(self.stats_deltas() if is_new else {}))
         
     def delete(self, *args, **kwargs):
         """
-        Override delete to handle reference counting and file cleanup
+        Override delete to handle reference counting and file cleanup.
+        Deleting an original that still has duplicates promotes the oldest
+        duplicate to be the new original.
         """
+        heir = None
         try:
-            if self.is_duplicate and self.reference_file:
-                # If this is a duplicate, decrement reference count on the original
-                original = self.reference_file
-                if original.reference_count > 0:
-                    original.reference_count -= 1
-                    original.save(update_fields=['reference_count'])
-                    logger.info(f"Decremented reference count for {original.id} to {original.reference_count}")
-            elif not self.is_duplicate:
-                # If this is an original file, check if it has duplicates
-                duplicates = self.__class__.objects.filter(reference_file=self)
-                if duplicates.exists():
-                    # Prevent deletion if it has duplicates
-                    # Just mark it as inactive rather than deleting
-                    logger.warning(f"File {self.id} has {duplicates.count()} duplicates, can't delete physical file")
-                else:
-                    # If no duplicates, delete the actual file
-                    try:
-                        if default_storage.exists(self.file.name):
-                            default_storage.delete(self.file.name)
-                            logger.info(f"Deleted physical file: {self.file.name}")
-                    except Exception as e:
-                        logger.error(f"Error deleting file {self.file.name}: {str(e)}")
-            
-            # Delete the database record
-            super().delete(*args, **kwargs)
+            with transaction.atomic():
+                # Each record owns its stored file unless another record still points at
+                # the same one; check before the duplicates are handed over to a heir
+                owns_stored_file = not self.shares_stored_file()
+                
+                if self.is_duplicate and self.reference_file_id:
+                    # If this is a duplicate, decrement reference count on the original
+                    # with a single UPDATE - no need to load the original first
+                    decremented = self.__class__.objects.filter(
+                        pk=self.reference_file_id, reference_count__gt=0
+                    ).update(reference_count=F('reference_count') - 1)
+                    if decremented:
+                        logger.info(f"Decremented reference count for {self.reference_file_id}")
+                elif not self.is_duplicate:
+                    # Lock this original first - uploads lock it before linking to it,
+                    # so no new duplicate can appear while it is being deleted
+                    list(self.__class__.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+                    
+                    # Hand the remaining duplicates over to the oldest one
+                    heir = self.__class__.objects.filter(reference_file=self).order_by('uploaded_at').first()
+                    if heir:
+                        others = self.__class__.objects.filter(reference_file=self).exclude(pk=heir.pk).update(reference_file=heir)
+                        heir.reference_count = others + 1
+                    
+                    # Release the content-defined chunks of an original
+                    self.release_chunks()
+                
+                if owns_stored_file:
+                    transaction.on_commit(lambda name=self.file.name: self._delete_stored_file(name))
+                
+                # Delete the database record
+                super().delete(*args, **kwargs)
+                StorageStats.adjust(**self.stats_deltas(-1))
+                
+                if heir:
+                    # Promote after the delete so the old original no longer holds the hash
+                    deltas = Counter(heir.stats_deltas(-1))
+                    heir.is_duplicate, heir.reference_file, heir.actual_size = False, None, heir.size
+                    self.__class__.objects.filter(pk=heir.pk).update(
+                        is_duplicate=False, reference_file=None,
+                        actual_size=heir.size, reference_count=heir.reference_count
+                    )
+                    # A heir that kept its own copy already counted its actual size
+                    deltas.update(heir.stats_deltas())
+                    StorageStats.adjust(**deltas)
+                    logger.info(f"Promoted {heir.id} to original in place of {self.id}")
         
         except Exception as e:
             logger.error(f"Error during file deletion: {str(e)}")
             raise
 
-    @classmethod
+    def shares_stored_file(self):
+        """
+        Return True if another record points at this one's stored file.
+        Only an original and its duplicates can share one (storages without
+        hardlinks, files stored before them), so only those are checked,
+        through indexed columns rather than the file name.
+        """
+        related = Q(reference_file=self)
+        if self.is_duplicate and self.reference_file_id:
+            related |= Q(pk=self.reference_file_id) | Q(reference_file_id=self.reference_file_id)
+        return self.__class__.objects.filter(related, file=self.file.name).exclude(pk=self.pk).exists()
+
+    @staticmethod
+    def _delete_stored_file(name):
+        """Remove a stored file from storage, logging rather than raising on failure"""
+        try:
+            if default_storage.exists(name):
+                try:
+                    HashCache.forget(default_storage.path(name))
+                except NotImplementedError:
+                    # Remote storages have no local path, so nothing was cached
+                    pass
+                default_storage.delete(name)
+                logger.info(f"Deleted physical file: {name}")
+        except Exception as e:
+            logger.error(f"Error deleting file {name}: {str(e)}")
+
+    def link_to_original(self, original):
+        """Set this new file up as a duplicate that shares the original's stored content"""
+        self.reference_file = original
+        self.is_duplicate = True
+        self.actual_size = 0  # No additional storage used
+        
+        # Don't store the content again - hardlink the original's file where the
+        # storage allows it, so each record can be deleted independently
+        self.file = self.link_stored_file(original.file.name)
+
+    def link_stored_file(self, name):
+        """
+        Hardlink a stored file to a new name for this record and return that name.
+        The link shares the original's blocks, so it takes no extra space.
+        Storages without local paths (or filesystems without hardlinks) get the
+        original name back and both records share the one stored file.
+        """
+        try:
+            source = default_storage.path(name)
+        except NotImplementedError:
+            return name
+        
+        new_name = default_storage.get_available_name(
+            self._meta.get_field('file').generate_filename(self, os.path.basename(name))
+        )
+        try:
+            os.makedirs(os.path.dirname(default_storage.path(new_name)), exist_ok=True)
+            os.link(source, default_storage.path(new_name))
+        except OSError as e:
+            logger.warning(f"Could not hardlink {name}, sharing the stored file instead: {str(e)}")
+            return name
+        return new_name
+
+    def find_existing_copy(self):
+        """
+        Find the original file holding the same content as this one, if any.
+        Only originals of the same size can match, so the content hash is only
+        calculated when at least one exists. When xxhash is installed, the
+        candidates are first narrowed by the cheap xxh3 hash, so SHA-256 only
+        runs on likely matches. Same-size originals that were stored without
+        a hash get theirs calculated on demand.
+        """
+        candidates = self.__class__.objects.filter(size=self.size, is_duplicate=False)
+        if not candidates.exists():
+            return None
+        
+        needs_sha256 = not self.content_hash_raw or candidates.filter(content_hash_raw__isnull=True).exists()
+        if needs_sha256 and fast_hashing_available():
+            # Narrow the candidates with the much cheaper xxh3 hash before any SHA-256 work
+            if self.fast_hash is None:
+                self.calculate_fast_hash()
+            if self.fast_hash is not None:
+                unhashed = candidates.filter(fast_hash__isnull=True).only('id', 'file', 'original_filename', 'size')
+                for candidate in unhashed:
+                    self.__class__.objects.filter(pk=candidate.pk).update(fast_hash=candidate.calculate_fast_hash())
+                
+                # Candidates whose fast hash couldn't be calculated stay in
+                candidates = candidates.filter(Q(fast_hash=self.fast_hash) | Q(fast_hash__isnull=True))
+                if not candidates.exists():
+                    return None
+        
+        if needs_sha256:
+            if not self.content_hash_raw:
+                self.calculate_hash()
+            
+            unhashed = candidates.filter(content_hash_raw__isnull=True).only('id', 'file', 'original_filename', 'size')
+            for candidate in unhashed:
+                self.__class__.objects.filter(pk=candidate.pk).update(content_hash_raw=candidate.calculate_hash())
+        
+        # A fast hash match is only confirmed by the SHA-256 hash
+        return self.find_duplicate_by_content(self.content_hash_raw, for_update=True)
+
+    def index_chunks(self):
+        """
+        Split a large original file into content-defined chunks and record them,
+        so content it shares with other files is detected even when the files
+        aren't identical. Fills in the content hash from the same pass if missing.
+        Too slow for the upload request; run by the index_chunks management command.
+        Returns the number of bytes found in chunks that were already known.
+        """
+        if self.is_duplicate or self.size < CDC_THRESHOLD or not chunking_available():
+            return 0
+        if self.chunk_refs.exists():
+            return 0
+            
+        sha256_hash = None if self.content_hash_raw else best_sha256()
+        was_closed = self.file.closed
+        try:
+            self.file.open('rb')
+            try:
+                chunks = chunk_file(self.file, sha256_hash)
+            finally:
+                if was_closed:
+                    self.file.close()
+        except (IOError, OSError) as e:
+            logger.warning(f"Unable to chunk {self.original_filename}: {str(e)}")
+            return 0
+            
+        if not chunks:
+            return 0
+            
+        chunk_sizes = dict(chunks)
+        with transaction.atomic():
+            known = set(FileChunk.objects.filter(content_hash__in=chunk_sizes).values_list('content_hash', flat=True))
+            FileChunk.objects.bulk_create(
+                [FileChunk(content_hash=h, size=size) for h, size in chunk_sizes.items() if h not in known],
+                ignore_conflicts=True
+            )
+            FileChunk.objects.filter(content_hash__in=chunk_sizes).update(reference_count=F('reference_count') + 1)
+            FileChunkRef.objects.bulk_create(
+                [FileChunkRef(file=self, index=i, chunk_id=h) for i, (h, _) in enumerate(chunks)]
+            )
+            
+            if sha256_hash is not None:
+                self.content_hash_raw = sha256_hash.digest()
+                self.__class__.objects.filter(pk=self.pk).update(content_hash_raw=self.content_hash_raw)
+        
+        shared_bytes = sum(size for h, size in chunk_sizes.items() if h in known)
+        logger.info(f"Indexed {len(chunks)} chunks for {self.original_filename}, {shared_bytes} bytes shared with other files")
+        return shared_bytes
+    
+    def release_chunks(self):
+        """Drop this file's chunk references and forget chunks no other file uses"""
+        chunk_hashes = set(self.chunk_refs.values_list('chunk_id', flat=True))
+        if not chunk_hashes:
+            return
+            
+        self.chunk_refs.all().delete()
+        chunks = FileChunk.objects.filter(content_hash__in=chunk_hashes)
+        chunks.update(reference_count=F('reference_count') - 1)
+        chunks.filter(reference_count=0).delete()
+
     @classmethod
     def find_duplicate(cls, file_hash):
-        """Find a file with the same hash if it exists"""
-        return cls.objects.filter(content_hash=file_hash, is_duplicate=False).first()
+        """Find a file with the same raw SHA-256 digest if it exists"""
+        return cls.find_duplicate_by_content(file_hash)
         
     @classmethod
-    def find_duplicate_by_content(cls, content_hash):
+    def find_duplicate_by_content(cls, content_hash, for_update=False):
         """
-        Find a file with the same content hash that's not itself a duplicate.
+        Find a file with the same raw content hash that's not itself a duplicate.
         This ensures we always reference the original source file.
+        With for_update the original's row stays locked until the transaction ends.
         """
         if not content_hash:
             return None
-            
-        return cls.objects.filter(
-            content_hash=content_hash,
-            is_duplicate=False
-        ).order_by('uploaded_at').first()
+        
+        # At most one original exists per hash (see uniq_original_hash), so this
+        # is a plain unique index lookup with no sorting
+        queryset = cls.objects.select_for_update() if for_update else cls.objects.all()
+        try:
+            return queryset.get(content_hash_raw=content_hash, is_duplicate=False)
+        except cls.DoesNotExist:
+            return None
+        
+    @classmethod
+    def bulk_ingest(cls, uploads):
+        """
+        Store a batch of uploaded files with content-based deduplication in a
+        fixed number of queries, however many files there are: one SELECT for
+        the matching originals, one INSERT each for the new originals and the
+        duplicates, and one UPDATE for the reference counts (plus a SELECT, a
+        HashCache lookup and store, and one UPDATE for same-size originals that
+        still need hashing).
+        Files repeated within the batch are linked to the first one.
+        Returns the new File records in upload order.
+        """
+        files = []
+        for upload in uploads:
+            # Uploads received through the hashing upload handlers are already hashed
+            upload_hash = getattr(upload, 'sha256', None) or hash_file(upload)
+            files.append(cls(
+                file=upload,
+                original_filename=upload.name,
+                file_type=upload.content_type or 'application/octet-stream',
+                size=upload.size,
+                content_hash_raw=upload_hash.digest(),
+                fast_hash=getattr(upload, 'fast_hash', None),
+            ))
+        if not files:
+            return []
+        
+        # Same-size originals stored without a hash get theirs calculated first
+        unhashed = list(cls.objects.filter(
+            size__in={f.size for f in files}, is_duplicate=False, content_hash_raw__isnull=True
+        ).only('id', 'file', 'original_filename', 'size'))
+        if unhashed:
+            keys = {candidate.pk: candidate.hash_cache_key() for candidate in unhashed}
+            cached = HashCache.lookup([key for key in keys.values() if key])
+            new_entries = []
+            for candidate in unhashed:
+                candidate.content_hash_raw = cached.get(keys[candidate.pk])
+                if candidate.content_hash_raw is not None:
+                    continue
+                digest = candidate._read_hash_or_none()
+                if digest is None:
+                    candidate.use_fallback_hash()
+                    continue
+                candidate.content_hash_raw = digest
+                if keys[candidate.pk]:
+                    new_entries.append((keys[candidate.pk], digest))
+            cls.objects.bulk_update(unhashed, ['content_hash_raw'])
+            HashCache.store(new_entries)
+        
+        new_originals, duplicates, links = [], [], []
+        try:
+            with transaction.atomic():
+                # Lock the matching originals, as File.save does for a single upload
+                originals = {
+                    bytes(original.content_hash_raw): original
+                    for original in cls.objects.select_for_update().filter(
+                        content_hash_raw__in={f.content_hash_raw for f in files}, is_duplicate=False
+                    )
+                }
+                
+                for f in files:
+                    if f.content_hash_raw in originals:
+                        duplicates.append(f)
+                    else:
+                        f.actual_size = f.size
+                        originals[f.content_hash_raw] = f
+                        new_originals.append(f)
+                
+                # Store the originals first so the duplicates have a stored file to link to
+                cls.objects.bulk_create(new_originals)
+                
+                added_refs = Counter()
+                for f in duplicates:
+                    original = originals[f.content_hash_raw]
+                    f.link_to_original(original)
+                    if f.file.name != original.file.name:
+                        links.append(f.file.name)
+                    added_refs[f.reference_file_id] += 1
+                cls.objects.bulk_create(duplicates)
+                
+                if added_refs:
+                    cls.objects.filter(pk__in=added_refs).update(reference_count=F('reference_count') + Case(
+                        *[When(pk=pk, then=Value(count)) for pk, count in added_refs.items()],
+                        output_field=IntegerField()
+                    ))
+                
+                totals = Counter()
+                for f in files:
+                    totals.update(f.stats_deltas())
+                StorageStats.adjust(**totals)
+        except IntegrityError:
+            # The rollback leaves the copies stored for the new originals and the
+            # duplicates' hardlinks behind, as the failed insert of File.save does
+            for name in [f.file.name for f in new_originals if f.file._committed] + links:
+                cls._delete_stored_file(name)
+            raise
+        
+        logger.info(f"Bulk ingested {len(files)} files, {len(duplicates)} of them duplicates")
+        return files
         
     def verify_duplicate_status(self):
         """
@@ -210,51 +601,135 @@ class File(models.Model):
                 return True
                 
             # Verify content hash matches the reference file
-            reference_hash = self.reference_file.content_hash or self.reference_file.calculate_hash()
-            my_hash = self.content_hash or self.calculate_hash()
+            reference_hash = bytes(self.reference_file.content_hash_raw or self.reference_file.calculate_hash())
+            my_hash = bytes(self.content_hash_raw or self.calculate_hash())
             
             if my_hash != reference_hash:
-                logger.warning(f"Hash mismatch: File {self.id} has hash {my_hash} but reference {self.reference_file.id} has {reference_hash}")
+                logger.warning(f"Hash mismatch: File {self.id} has hash {my_hash.hex()} but reference {self.reference_file.id} has {reference_hash.hex()}")
                 return False
             return True
         except Exception as e:
             logger.error(f"Error verifying duplicate status: {str(e)}")
             return False
             
+    def _read_hash_or_none(self):
+        """read_content_hash for worker threads, returning None instead of raising"""
+        try:
+            return self.read_content_hash()
+        except Exception as e:
+            logger.error(f"Error calculating hash for {self.original_filename}: {str(e)}")
+            return None
+    
+    def merge_into(self, original):
+        """
+        Turn this original into a duplicate of another original with the same
+        content, handing its own duplicates over to it as well. Its stored file
+        is replaced by a hardlink to the original's where the storage allows it;
+        otherwise it keeps its own copy, and with it its actual size.
+        """
+        old_name = self.file.name
+        deltas = Counter(self.stats_deltas(-1))
+        
+        with transaction.atomic():
+            # Files stored before hardlinks may still be shared with this one's duplicates
+            owns_stored_file = not self.shares_stored_file()
+            moved = self.__class__.objects.filter(reference_file=self).update(reference_file=original)
+            self.release_chunks()
+            
+            new_name = self.link_stored_file(original.file.name)
+            if new_name != original.file.name:
+                self.file.name = new_name
+                self.actual_size = 0
+                if owns_stored_file:
+                    transaction.on_commit(lambda: self._delete_stored_file(old_name))
+            
+            self.is_duplicate, self.reference_file, self.reference_count = True, original, 1
+            self.__class__.objects.filter(pk=self.pk).update(
+                file=self.file.name, content_hash_raw=self.content_hash_raw, is_duplicate=True,
+                reference_file=original, actual_size=self.actual_size, reference_count=1
+            )
+            self.__class__.objects.filter(pk=original.pk).update(
+                reference_count=F('reference_count') + moved + 1
+            )
+            
+            deltas.update(self.stats_deltas())
+            StorageStats.adjust(**deltas)
+        
+        logger.info(f"Merged {self.id} into {original.id}, moving {moved} duplicates")
+
     @classmethod
     def recheck_duplicates(cls):
         """
         Utility method to recheck all files for duplicate content.
         Useful for maintenance or if hash calculation logic has been improved.
+        Originals that turn out to hold the same content as another original
+        are merged into it, oldest first.
         """
+        BATCH_SIZE = 500
+        
         try:
             logger.info("Starting system-wide duplicate check")
-            files = cls.objects.all()
             
-            # First, ensure all files have content hashes
-            for file in files:
-                if not file.content_hash:
-                    try:
-                        file.calculate_hash()
-                        file.save(update_fields=['content_hash'])
-                    except Exception as e:
-                        logger.error(f"Failed to calculate hash for {file.id}: {str(e)}")
-            
-            # Then, check for duplicates
-            unique_hashes = {}
-            for file in files.filter(is_duplicate=False):
-                if file.content_hash in unique_hashes:
-                    # Already have a file with this hash
-                    other_file = unique_hashes[file.content_hash]
-                    logger.info(f"Found duplicates: {file.original_filename} and {other_file.original_filename}")
-                else:
-                    unique_hashes[file.content_hash] = file
+            # Ensure all files have content hashes. Unchanged files are answered
+            # from the HashCache, the rest are read in parallel (hashlib releases
+            # the GIL) and written back per batch; every file gets a hash, so
+            # each batch shrinks the unhashed set.
+            unhashed = cls.objects.filter(content_hash_raw__isnull=True).order_by('uploaded_at').only(
+                'id', 'file', 'original_filename', 'size', 'is_duplicate', 'actual_size', 'reference_count'
+            )
+            merged = 0
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                while True:
+                    batch = list(unhashed[:BATCH_SIZE])
+                    if not batch:
+                        break
+                    
+                    # The worker threads only read files; all queries stay on this thread
+                    keys = {file.pk: file.hash_cache_key() for file in batch}
+                    cached = HashCache.lookup([key for key in keys.values() if key])
+                    misses = []
+                    for file in batch:
+                        file.content_hash_raw = cached.get(keys[file.pk])
+                        if file.content_hash_raw is None:
+                            misses.append(file)
                     
-            logger.info(f"Duplicate check complete. Found {len(files) - len(unique_hashes)} potential duplicates")
+                    new_entries = []
+                    for file, digest in zip(misses, executor.map(cls._read_hash_or_none, misses)):
+                        if digest is None:
+                            file.use_fallback_hash()
+                            continue
+                        file.content_hash_raw = digest
+                        if keys[file.pk]:
+                            new_entries.append((keys[file.pk], digest))
+                    
+                    # Only one original may hold a hash (see uniq_original_hash), so
+                    # originals matching an existing one or an older one in the
+                    # batch are merged into it rather than given the hash as well
+                    holders = {
+                        bytes(original.content_hash_raw): original
+                        for original in cls.objects.filter(
+                            is_duplicate=False,
+                            content_hash_raw__in={file.content_hash_raw for file in batch if not file.is_duplicate}
+                        ).only('id', 'file', 'content_hash_raw')
+                    }
+                    with transaction.atomic():
+                        hashed = []
+                        for file in batch:
+                            holder = None if file.is_duplicate else holders.setdefault(bytes(file.content_hash_raw), file)
+                            if holder is not None and holder is not file:
+                                file.merge_into(holder)
+                                merged += 1
+                            else:
+                                hashed.append(file)
+                        cls.objects.bulk_update(hashed, ['content_hash_raw'])
+                    HashCache.store(new_entries)
+            
+            logger.info(f"Duplicate check complete. Merged {merged} originals into ones with the same content")
             return True
         except Exception as e:
             logger.error(f"Error in recheck_duplicates: {str(e)}")
             return False
+
     @property
     def storage_saved(self):
         """Calculate storage space saved if this is a duplicate file"""
@@ -262,40 +737,175 @@ class File(models.Model):
             return self.size - self.actual_size
         return 0
 
+    def stats_deltas(self, sign=1):
+        """Return this file's contribution to the StorageStats counters, negated with sign=-1"""
+        deltas = {
+            'duplicate_files' if self.is_duplicate else 'unique_files': 1,
+            'total_size': self.size,
+            'actual_size': self.actual_size,
+            'bytes_saved': self.storage_saved,
+        }
+        return {name: sign * value for name, value in deltas.items()}
+
     @classmethod
     def get_total_storage_saved(cls):
         """Return the total storage saved through deduplication"""
-        duplicates = cls.objects.filter(is_duplicate=True)
-        return sum(duplicate.storage_saved for duplicate in duplicates)
+        return StorageStats.get().bytes_saved
         
     @classmethod
     def update_reference_counts(cls):
         """Update reference counts for all files"""
         try:
-            # Get all original files
-            originals = cls.objects.filter(is_duplicate=False)
-            for original in originals:
-                # Count duplicates
-                duplicate_count = cls.objects.filter(reference_file=original).count()
-                # Update reference count
-                original.reference_count = duplicate_count + 1  # +1 for the original itself
-                original.save(update_fields=['reference_count'])
+            # Count duplicates per original in a correlated subquery so the
+            # whole table is updated in a single UPDATE statement
+            duplicate_counts = cls.objects.filter(
+                reference_file=OuterRef('pk')
+            ).order_by().values('reference_file').annotate(c=Count('*')).values('c')
+            
+            cls.objects.filter(is_duplicate=False).update(
+                # +1 for the original itself
+                reference_count=Coalesce(Subquery(duplicate_counts, output_field=IntegerField()), 0) + 1
+            )
             return True
         except Exception as e:
             logger.error(f"Error updating reference counts: {str(e)}")
             return False
 
+    @classmethod
+    def get_chunk_storage_saved(cls):
+        """Return the bytes shared between original files at chunk level"""
+        referenced = FileChunkRef.objects.aggregate(total=Sum('chunk__size'))['total'] or 0
+        stored = FileChunk.objects.aggregate(total=Sum('size'))['total'] or 0
+        return referenced - stored
 
-# Signal handlers for post-save and post-delete actions
-@receiver(post_save, sender=File)
-def update_file_references(sender, instance, created, **kwargs):
-    """Update reference counts when a file is saved"""
-    if created and instance.is_duplicate and instance.reference_file:
-        try:
-            # Increment reference count on the original file
-            original = instance.reference_file
-            original.reference_count += 1
-            original.save(update_fields=['reference_count'])
-            logger.info(f"Incremented reference count for {original.id} to {original.reference_count}")
-        except Exception as e:
-            logger.error(f"Error updating reference count: {str(e)}")
+
+class FileChunk(models.Model):
+    """A content-defined chunk of one or more original files, keyed by its SHA-256"""
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    reference_count = models.PositiveIntegerField(default=0, help_text="Number of files containing this chunk")
+
+
+class FileChunkRef(models.Model):
+    """Position of a chunk within a file"""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='chunk_refs')
+    index = models.PositiveIntegerField()
+    chunk = models.ForeignKey(FileChunk, on_delete=models.PROTECT, related_name='refs')
+    
+    class Meta:
+        ordering = ['file', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'index'], name='uniq_file_chunk_index'),
+        ]
+
+
+class HashCache(models.Model):
+    """
+    SHA-256 digests of stored files keyed by their filesystem identity, so a
+    file that hasn't changed since it was last hashed isn't read again.
+    """
+    device = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    size = models.BigIntegerField()
+    content_hash_raw = models.BinaryField(max_length=32)
+    
+    KEY_FIELDS = ('device', 'inode', 'mtime_ns', 'size')
+    
+    class Meta:
+        constraints = [
+            # Lookups go by inode first, the rest tells reused inodes and changed files apart
+            models.UniqueConstraint(fields=['inode', 'device', 'mtime_ns', 'size'], name='uniq_hash_cache_key'),
+        ]
+    
+    @staticmethod
+    def key_for(path):
+        """Return the (device, inode, mtime_ns, size) key of a file, or None if it doesn't fit the columns"""
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        return key if all(0 <= value < (1 << 63) for value in key) else None
+    
+    @classmethod
+    def lookup(cls, keys):
+        """Return a {key: raw digest} dict for the given keys that are cached, in one query"""
+        keys = set(keys)
+        if not keys:
+            return {}
+        rows = cls.objects.filter(inode__in={key[1] for key in keys}).values_list(*cls.KEY_FIELDS, 'content_hash_raw')
+        return {tuple(row[:4]): bytes(row[4]) for row in rows if tuple(row[:4]) in keys}
+    
+    @classmethod
+    def store(cls, entries):
+        """Cache (key, raw digest) pairs; keys that are already cached are left alone"""
+        cls.objects.bulk_create(
+            [cls(content_hash_raw=digest, **dict(zip(cls.KEY_FIELDS, key))) for key, digest in entries],
+            ignore_conflicts=True
+        )
+    
+    @classmethod
+    def forget(cls, path):
+        """
+        Drop the cached digest of a file that is about to be removed. Other
+        hardlinks to the same content share its key, so it stays while they exist.
+        """
+        st = os.stat(path)
+        if st.st_nlink > 1:
+            return
+        cls.objects.filter(
+            inode=st.st_ino, device=st.st_dev, mtime_ns=st.st_mtime_ns, size=st.st_size
+        ).delete()
+
+
+class StorageStats(models.Model):
+    """
+    Single row of running totals, updated as files are added and removed,
+    so dashboard numbers don't need a scan of the whole file table.
+    """
+    unique_files = models.BigIntegerField(default=0)
+    duplicate_files = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0, help_text="Logical size of all files")
+    actual_size = models.BigIntegerField(default=0, help_text="Storage actually used")
+    bytes_saved = models.BigIntegerField(default=0, help_text="Storage saved through deduplication")
+    version = models.BigIntegerField(default=0, help_text="Bumped by every write to the file table, for cache invalidation")
+    
+    class Meta:
+        verbose_name_plural = 'storage stats'
+    
+    @property
+    def total_files(self):
+        return self.unique_files + self.duplicate_files
+    
+    @classmethod
+    def get(cls):
+        """Return the stats row, rebuilding it if it is missing"""
+        return cls.objects.filter(pk=1).first() or cls.rebuild()
+    
+    @classmethod
+    def adjust(cls, **deltas):
+        """
+        Apply deltas to the counters and bump the version with a single atomic
+        UPDATE. Call after the file change is written, as a missing row is
+        rebuilt from the current table contents.
+        """
+        updated = cls.objects.filter(pk=1).update(
+            version=F('version') + 1, **{name: F(name) + delta for name, delta in deltas.items()}
+        )
+        if not updated:
+            cls.rebuild()
+    
+    @classmethod
+    def rebuild(cls):
+        """Recalculate the counters from the file table"""
+        totals = File.objects.aggregate(
+            # Ahead of the actual_size alias, which would shadow the column here
+            bytes_saved=Sum(STORAGE_SAVED, filter=Q(is_duplicate=True)),
+            unique_files=Count('id', filter=Q(is_duplicate=False)),
+            duplicate_files=Count('id', filter=Q(is_duplicate=True)),
+            total_size=Sum('size'),
+            actual_size=Sum('actual_size')
+        )
+        defaults = {name: value or 0 for name, value in totals.items()}
+        # Start from the clock so a lost row never repeats an old version
+        defaults['version'] = time.time_ns()
+        stats, _ = cls.objects.update_or_create(pk=1, defaults=defaults)
+        return stats
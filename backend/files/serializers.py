@@ -1,14 +1,13 @@
 from rest_framework import serializers
 from .models import File
-import os
-import hashlib
-import tempfile
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+import logging
+
+logger = logging.getLogger(__name__)
 
 class FileSerializer(serializers.ModelSerializer):
     storage_saved = serializers.SerializerMethodField()
     is_duplicate = serializers.BooleanField(read_only=True)
+    content_hash = serializers.CharField(read_only=True)
     
     class Meta:
         model = File
@@ -18,6 +17,17 @@ class FileSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'uploaded_at', 'content_hash', 'is_duplicate', 'storage_saved']
     
+    def get_fields(self):
+        """
+        The stored content and its size are fixed once a file exists: the
+        duplicate links and the StorageStats counters are derived from them.
+        """
+        fields = super().get_fields()
+        if self.instance is not None:
+            for name in ('file', 'size'):
+                fields[name].read_only = True
+        return fields
+    
     def get_storage_saved(self, obj):
         """Return the amount of storage saved if file is deduplicated"""
         return obj.storage_saved
@@ -26,77 +36,28 @@ class FileSerializer(serializers.ModelSerializer):
         """
         Handle file upload with deduplication.
         If a file with the same content hash exists, create a reference to it.
+        Storage and database failures propagate, so they aren't reported as invalid input.
         """
-        try:
-            upload_file = validated_data['file']
-            
-            # Calculate hash directly without saving the file
-            file_hash = self._calculate_file_hash(upload_file)
-            
-            # Check if a file with the same hash already exists
-            existing_file = File.find_duplicate(file_hash)
-            
-            # Create the file instance after hash calculation
-            file_instance = File(
-                file=upload_file,
-                original_filename=validated_data['original_filename'],
-                file_type=validated_data['file_type'],
-                size=validated_data['size'],
-                content_hash=file_hash
-            )
-            
-            if existing_file:
-                # This is a duplicate - create a new record that references the original
-                file_instance.is_duplicate = True
-                file_instance.reference_file = existing_file
-                file_instance.actual_size = 0  # Actual disk space used is minimal for references
-                
-                # Don't save the file content again, just save the model
-                file_instance.file = existing_file.file
-                file_instance.save()
-                
-                # Log deduplication success
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(f"Deduplicated file: {file_instance.original_filename}, saved {file_instance.size} bytes")
-                
-                return file_instance
-            else:
-                # Not a duplicate - save as normal
-                file_instance.actual_size = file_instance.size  # For non-duplicates, actual size = file size
-                file_instance.save()
-                
-                return file_instance
-                
-        except Exception as e:
-            # Log the error
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error during file upload: {str(e)}")
-            raise serializers.ValidationError(f"File upload failed: {str(e)}")
-            
-    def _calculate_file_hash(self, file):
-        """Calculate SHA-256 hash for a file without modifying the original file."""
-        try:
-            sha256_hash = hashlib.sha256()
-            
-            # Save the current position
-            pos = file.tell()
-            
-            # Reset to the beginning of the file
-            file.seek(0)
-            
-            # Read and update hash in chunks to efficiently handle large files
-            for chunk in iter(lambda: file.read(4096), b""):
-                sha256_hash.update(chunk)
-            
-            # Reset file position back to where it was
-            file.seek(pos)
-            
-            return sha256_hash.hexdigest()
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error calculating file hash: {str(e)}")
-            # Re-raise as validation error with clear message
-            raise serializers.ValidationError(f"Unable to process file: {str(e)}")
+        upload_file = validated_data['file']
+        
+        # The upload handlers hash the content while it is received;
+        # otherwise File.save hashes it if a same-size original exists
+        upload_hash = getattr(upload_file, 'sha256', None)
+        
+        # Deduplication is handled by File.save, which runs the duplicate
+        # lookup, the INSERT and the reference count UPDATE in one transaction
+        file_instance = File(
+            file=upload_file,
+            original_filename=validated_data['original_filename'],
+            file_type=validated_data['file_type'],
+            size=validated_data['size'],
+            content_hash_raw=upload_hash.digest() if upload_hash else None,
+            fast_hash=getattr(upload_file, 'fast_hash', None)
+        )
+        file_instance.save()
+        
+        if file_instance.is_duplicate:
+            # Log deduplication success
+            logger.info(f"Deduplicated file: {file_instance.original_filename}, saved {file_instance.size} bytes")
+        
+        return file_instance
@@ -0,0 +1,383 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .models import File, HashCache, StorageStats
+from .views import OptimizedPagination
+
+
+class MediaRootMixin:
+    """Store uploads in a temporary MEDIA_ROOT that is removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class FileDeduplicationTests(MediaRootMixin, APITestCase):
+    """Uploads, duplicates and deletes through the API"""
+
+    def upload(self, name, content):
+        response = self.client.post('/api/files/', {
+            'file': SimpleUploadedFile(name, content, content_type='text/plain'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return File.objects.get(pk=response.data['id'])
+
+    def delete(self, file):
+        # Stored files are removed once the delete commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/files/{file.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def assertCountersMatchTable(self):
+        stats = StorageStats.get()
+        rebuilt = StorageStats.rebuild()
+        for name in ('unique_files', 'duplicate_files', 'total_size', 'actual_size', 'bytes_saved'):
+            self.assertEqual(getattr(stats, name), getattr(rebuilt, name), name)
+        self.assertEqual(File.get_total_storage_saved(), rebuilt.bytes_saved)
+
+    def test_unique_upload(self):
+        original = self.upload('a.txt', b'hello world')
+
+        self.assertFalse(original.is_duplicate)
+        self.assertEqual(original.actual_size, original.size)
+        self.assertEqual(original.reference_count, 1)
+        self.assertEqual(original.content_hash, hashlib.sha256(b'hello world').hexdigest())
+        self.assertCountersMatchTable()
+
+    def test_duplicate_upload_links_to_original(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+        original.refresh_from_db()
+
+        self.assertTrue(duplicate.is_duplicate)
+        self.assertEqual(duplicate.reference_file_id, original.id)
+        self.assertEqual(duplicate.actual_size, 0)
+        self.assertEqual(duplicate.storage_saved, duplicate.size)
+        self.assertEqual(original.reference_count, 2)
+        # Each record has its own name for the same stored content
+        self.assertNotEqual(duplicate.file.name, original.file.name)
+        self.assertTrue(os.path.samefile(duplicate.file.path, original.file.path))
+        self.assertCountersMatchTable()
+
+    def test_delete_duplicate(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+
+        self.delete(duplicate)
+        original.refresh_from_db()
+
+        self.assertEqual(original.reference_count, 1)
+        self.assertFalse(os.path.exists(duplicate.file.path))
+        self.assertTrue(os.path.exists(original.file.path))
+        self.assertCountersMatchTable()
+
+    def test_delete_original_promotes_oldest_duplicate(self):
+        original = self.upload('a.txt', b'hello world')
+        heir = self.upload('b.txt', b'hello world')
+        other = self.upload('c.txt', b'hello world')
+
+        self.delete(original)
+        heir.refresh_from_db()
+        other.refresh_from_db()
+
+        self.assertFalse(heir.is_duplicate)
+        self.assertIsNone(heir.reference_file_id)
+        self.assertEqual(heir.actual_size, heir.size)
+        self.assertEqual(heir.reference_count, 2)
+        self.assertEqual(other.reference_file_id, heir.id)
+        # The heir's own link keeps the content after the original's file is gone
+        self.assertFalse(os.path.exists(original.file.path))
+        with heir.file.open('rb') as f:
+            self.assertEqual(f.read(), b'hello world')
+        self.assertCountersMatchTable()
+
+        # New uploads of the same content now link to the heir
+        duplicate = self.upload('d.txt', b'hello world')
+        self.assertEqual(duplicate.reference_file_id, heir.id)
+
+    def test_promoting_a_duplicate_with_its_own_copy(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+        # Merged originals that couldn't be hardlinked keep their own copy
+        File.objects.filter(pk=duplicate.pk).update(actual_size=duplicate.size)
+        StorageStats.rebuild()
+
+        self.delete(original)
+        duplicate.refresh_from_db()
+
+        self.assertFalse(duplicate.is_duplicate)
+        self.assertEqual(duplicate.actual_size, duplicate.size)
+        self.assertCountersMatchTable()
+
+    def test_delete_original_without_duplicates(self):
+        original = self.upload('a.txt', b'hello world')
+
+        self.delete(original)
+
+        self.assertFalse(File.objects.exists())
+        self.assertFalse(os.path.exists(original.file.path))
+        self.assertCountersMatchTable()
+
+    def test_shared_stored_file_outlives_its_first_record(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+        # Duplicates stored before hardlinks shared the original's stored file
+        File.objects.filter(pk=duplicate.pk).update(file=original.file.name)
+
+        self.delete(original)
+
+        self.assertTrue(os.path.exists(original.file.path))
+        heir = File.objects.get(pk=duplicate.pk)
+        self.assertFalse(heir.is_duplicate)
+        self.assertEqual(heir.file.name, original.file.name)
+
+    def test_update_keeps_content_and_size(self):
+        original = self.upload('a.txt', b'hello world')
+
+        response = self.client.patch(f'/api/files/{original.id}/', {
+            'size': 999, 'original_filename': 'renamed.txt',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        original.refresh_from_db()
+
+        self.assertEqual(original.size, 11)
+        self.assertEqual(original.original_filename, 'renamed.txt')
+        self.assertCountersMatchTable()
+
+    def test_shared_stored_file_outlives_a_duplicate(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+        File.objects.filter(pk=duplicate.pk).update(file=original.file.name)
+
+        self.delete(File.objects.get(pk=duplicate.pk))
+
+        self.assertTrue(os.path.exists(original.file.path))
+        self.assertTrue(File.objects.filter(pk=original.pk).exists())
+
+    def test_delete_forgets_cached_hash(self):
+        original = self.upload('a.txt', b'hello world')
+        duplicate = self.upload('b.txt', b'hello world')
+        original.calculate_hash()
+        self.assertEqual(HashCache.objects.count(), 1)
+
+        # The original's hardlink still holds the content, so its entry stays
+        self.delete(duplicate)
+        self.assertEqual(HashCache.objects.count(), 1)
+
+        self.delete(original)
+        self.assertFalse(HashCache.objects.exists())
+
+    def test_recheck_merges_originals_with_the_same_content(self):
+        first = self.upload('a.txt', b'hello world')
+        second = self.upload('b.txt', b'HELLO WORLD')
+        # Originals stored without a hash, which happen to hold the same content
+        with open(second.file.path, 'wb') as f:
+            f.write(b'hello world')
+        File.objects.update(content_hash_raw=None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(File.recheck_duplicates())
+        first.refresh_from_db()
+        merged = File.objects.get(pk=second.pk)
+
+        self.assertFalse(first.is_duplicate)
+        self.assertEqual(first.reference_count, 2)
+        self.assertTrue(merged.is_duplicate)
+        self.assertEqual(merged.reference_file_id, first.id)
+        self.assertEqual(merged.actual_size, 0)
+        self.assertTrue(os.path.samefile(merged.file.path, first.file.path))
+        self.assertFalse(os.path.exists(second.file.path))
+        self.assertCountersMatchTable()
+
+
+class BulkUploadTests(MediaRootMixin, APITestCase):
+    """Batches of uploads through the bulk_upload action"""
+
+    def bulk_upload(self, contents):
+        return self.client.post('/api/files/bulk_upload/', {
+            'files': [
+                SimpleUploadedFile(f'{i}.txt', content, content_type='text/plain')
+                for i, content in enumerate(contents)
+            ],
+        }, format='multipart')
+
+    def stored_names(self):
+        return sorted(os.listdir(os.path.join(self.media_root, 'uploads')))
+
+    def test_bulk_upload_deduplicates(self):
+        existing = File.bulk_ingest([SimpleUploadedFile('a.txt', b'hello world')])[0]
+
+        response = self.bulk_upload([b'hello world', b'new content', b'new content'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        known, first, repeat = (File.objects.get(pk=file['id']) for file in response.data)
+        existing.refresh_from_db()
+
+        self.assertEqual(known.reference_file_id, existing.id)
+        self.assertEqual(existing.reference_count, 2)
+        self.assertFalse(first.is_duplicate)
+        self.assertEqual(repeat.reference_file_id, first.id)
+        self.assertTrue(os.path.samefile(repeat.file.path, first.file.path))
+        stats, rebuilt = StorageStats.get(), StorageStats.rebuild()
+        self.assertEqual(
+            (stats.unique_files, stats.duplicate_files, stats.actual_size, stats.bytes_saved),
+            (rebuilt.unique_files, rebuilt.duplicate_files, rebuilt.actual_size, rebuilt.bytes_saved)
+        )
+
+    def test_unhashed_originals_are_hashed_in_a_fixed_number_of_queries(self):
+        def ingest_against_unhashed(count, size):
+            contents = [bytes([65 + i]) * size for i in range(count)]
+            File.bulk_ingest([SimpleUploadedFile('old.txt', content) for content in contents])
+            File.objects.filter(size=size).update(content_hash_raw=None)
+            with CaptureQueriesContext(connection) as queries:
+                uploaded = File.bulk_ingest([SimpleUploadedFile('new.txt', content) for content in contents])
+            self.assertTrue(all(file.is_duplicate for file in uploaded))
+            return len(queries)
+
+        self.assertEqual(ingest_against_unhashed(1, 100), ingest_against_unhashed(4, 200))
+
+    def test_conflict_removes_stored_files(self):
+        File.bulk_ingest([SimpleUploadedFile('a.txt', b'hello world')])
+        before = self.stored_names()
+
+        # A concurrent upload storing the same content first fails the batch's writes
+        with mock.patch.object(StorageStats, 'adjust', side_effect=IntegrityError('conflict')):
+            response = self.bulk_upload([b'hello world', b'new content'])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(File.objects.count(), 1)
+        self.assertEqual(self.stored_names(), before)
+
+
+class FileListPaginationTests(MediaRootMixin, APITestCase):
+    """Cursor pages for the default order, numbered pages otherwise"""
+
+    def setUp(self):
+        super().setUp()
+        File.bulk_ingest([
+            SimpleUploadedFile(f'{i}.txt', f'content {i}'.encode(), content_type='text/plain')
+            for i in range(25)
+        ])
+
+    def follow(self, url):
+        """Return the ids of every file listed by following next links from url"""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 25)
+            ids += [file['id'] for file in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_default_order_pages_by_cursor(self):
+        response = self.client.get('/api/files/?page_size=10')
+        self.assertIn('cursor=', response.data['next'])
+
+        ids = self.follow('/api/files/?page_size=10')
+        expected = [str(pk) for pk in File.objects.order_by('-uploaded_at', '-id').values_list('id', flat=True)]
+        self.assertEqual(ids, expected)
+
+    def test_page_number_is_honoured(self):
+        response = self.client.get('/api/files/?page_size=10&page=2')
+        expected = [str(pk) for pk in File.objects.order_by('-uploaded_at', '-id').values_list('id', flat=True)[10:20]]
+        self.assertEqual([file['id'] for file in response.data['results']], expected)
+        self.assertIn('page=3', response.data['next'])
+
+    @mock.patch.object(OptimizedPagination, 'offset_cutoff', 5)
+    def test_low_cardinality_ordering_reaches_every_file(self):
+        # Every file ties on is_duplicate, more of them than a cursor can step over
+        response = self.client.get('/api/files/?page_size=10&ordering=is_duplicate')
+        self.assertIn('page=2', response.data['next'])
+
+        ids = self.follow('/api/files/?page_size=10&ordering=is_duplicate')
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+
+
+class MigrationTestCase(MediaRootMixin, TransactionTestCase):
+    """Run a data migration against rows created with the models it starts from"""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        super().setUp()
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_from])
+        self.old_apps = executor.loader.project_state([self.migrate_from]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        return executor.loader.project_state([self.migrate_to]).apps
+
+
+class ContentHashMigrationTests(MigrationTestCase):
+    """0008 and 0009: hex hashes become raw digests and originals sharing one are merged"""
+    migrate_from = ('files', '0007_storagestats')
+    migrate_to = ('files', '0009_uniq_original_hash')
+
+    def create_file(self, name, content_hash, **fields):
+        File = self.old_apps.get_model('files', 'File')
+        fields = {'size': 11, 'actual_size': 11, **fields}
+        return File.objects.create(
+            file=f'uploads/{name}', original_filename=name, file_type='text/plain',
+            content_hash=content_hash, **fields
+        )
+
+    def test_hex_hashes_become_raw_digests(self):
+        digest = hashlib.sha256(b'hello world').digest()
+        hashed = self.create_file('a.txt', digest.hex())
+        unhashed = self.create_file('b.txt', '')
+        invalid = self.create_file('c.txt', 'not hex')
+
+        apps = self.migrate()
+        File = apps.get_model('files', 'File')
+
+        self.assertEqual(bytes(File.objects.get(pk=hashed.pk).content_hash_raw), digest)
+        self.assertIsNone(File.objects.get(pk=unhashed.pk).content_hash_raw)
+        self.assertIsNone(File.objects.get(pk=invalid.pk).content_hash_raw)
+
+    def test_originals_sharing_a_hash_are_merged_into_the_oldest(self):
+        content_hash = hashlib.sha256(b'hello world').hexdigest()
+        keeper = self.create_file('a.txt', content_hash)
+        extra = self.create_file('b.txt', content_hash)
+        extra_duplicate = self.create_file(
+            'c.txt', content_hash, is_duplicate=True, reference_file=extra, actual_size=0
+        )
+        self.old_apps.get_model('files', 'StorageStats').objects.update_or_create(pk=1)
+
+        apps = self.migrate()
+        File = apps.get_model('files', 'File')
+        keeper, extra, extra_duplicate = (
+            File.objects.get(pk=f.pk) for f in (keeper, extra, extra_duplicate)
+        )
+
+        self.assertFalse(keeper.is_duplicate)
+        self.assertEqual(keeper.reference_count, 3)
+        self.assertTrue(extra.is_duplicate)
+        self.assertEqual(extra.reference_file_id, keeper.id)
+        self.assertEqual(extra_duplicate.reference_file_id, keeper.id)
+        # The merged original's stored file stays in place, so nothing was saved by it
+        self.assertEqual(extra.actual_size, extra.size)
+        self.assertEqual(apps.get_model('files', 'StorageStats').objects.get(pk=1).bytes_saved, 11)
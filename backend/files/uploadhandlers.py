@@ -0,0 +1,40 @@
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from .hashing import best_sha256, fast_hash_value, new_fast_hasher
+
+
+class HashingUploadMixin:
+    """
+    Hash upload data as it streams in, so the content hash is known without
+    reading the file back. The finished upload gets the hash object attached
+    as `sha256`, and the xxh3-64 pre-filter hash as `fast_hash` when xxhash
+    is installed.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set up the hashers first - the memory handler raises StopFutureHandlers here
+        self.sha256 = best_sha256()
+        self.xxh3 = new_fast_hasher()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # An inactive memory handler only passes chunks on to the next handler
+        if getattr(self, 'activated', True):
+            self.sha256.update(raw_data)
+            if self.xxh3 is not None:
+                self.xxh3.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256
+            file.fast_hash = fast_hash_value(self.xxh3) if self.xxh3 is not None else None
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """Keep small uploads in memory, hashing them as they arrive"""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file, hashing them as they arrive"""
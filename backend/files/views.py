@@ -1,17 +1,20 @@
-from django.shortcuts import render
-from django.db.models import Q, Min, Max, Sum, Count, F, Value, IntegerField
-from django.db.models.functions import Lower
+from django.db import IntegrityError, connection
+from django.db.models import Q, Min, Max, Sum, Count
 from rest_framework import viewsets, status, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, DateTimeFilter, NumberFilter, CharFilter
-from django_filters import BooleanFilter, MultipleChoiceFilter
+from django_filters import BooleanFilter
 from functools import reduce
-from operator import or_, and_
+from operator import or_
 import logging
-from datetime import datetime, timedelta
-from .models import File
+import re
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from .models import STORAGE_SAVED, File, StorageStats
+from .cache import COUNT_TIMEOUT, FILE_TYPES_TIMEOUT, STATS_TIMEOUT, versioned_key
 from .serializers import FileSerializer
 
 # Create your views here.
@@ -33,47 +36,124 @@ class FileFilter(FilterSet):
     # Advanced filters
     is_duplicate = BooleanFilter(field_name='is_duplicate')
     filename_contains = CharFilter(method='filter_filename_contains')
-    content_hash = CharFilter(field_name='content_hash', lookup_expr='exact')
+    content_hash = CharFilter(method='filter_content_hash')
+    
+    @property
+    def qs(self):
+        # Without any filter data there is nothing to validate or apply
+        if not self.data:
+            return self.queryset.all()
+        return super().qs
+    
+    # Hashes are stored as raw digests, the API takes them in hex
+    def filter_content_hash(self, queryset, name, value):
+        if not value:
+            return queryset
+        try:
+            digest = bytes.fromhex(value)
+        except ValueError:
+            return queryset.none()
+        return queryset.filter(content_hash_raw=digest)
     
     # For contextual word search in filenames
     def filter_filename_contains(self, queryset, name, value):
         if not value:
             return queryset
             
-        # Split search terms and create OR conditions for each word
-        search_terms = value.lower().split()
+        # Split search terms and match any distinct word
+        search_terms = dict.fromkeys(value.split())
         if not search_terms:
             return queryset
-            
-        # For each term, create a filter condition
-        queries = [Q(original_filename__icontains=term) for term in search_terms]
         
-        # Combine with OR
-        return queryset.filter(reduce(or_, queries))
+        if connection.vendor == 'postgresql':
+            # One case-insensitive pattern, answered by the trigram index
+            pattern = '|'.join(re.escape(term) for term in search_terms)
+            return queryset.filter(original_filename__iregex=pattern)
+        
+        # Elsewhere REGEXP is evaluated per row (a Python callback on SQLite),
+        # so OR together plain case-insensitive LIKEs instead
+        return queryset.filter(reduce(or_, (Q(original_filename__icontains=term) for term in search_terms)))
     
     class Meta:
         model = File
-        fields = [
-            'file_type', 'min_size', 'max_size', 
-            'upload_date_after', 'upload_date_before',
-            'is_duplicate', 'filename_contains', 'content_hash'
-        ]
+        # Every filter is declared above, none are generated from model fields
+        fields = []
+
+
+class FileFilterBackend(DjangoFilterBackend):
+    """Filter backend that leaves the queryset alone when the request has no query parameters"""
+    
+    def filter_queryset(self, request, queryset, view):
+        # Skip building and validating a FilterSet that has nothing to filter on
+        if not request.query_params:
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+class OrderedPagination(PageNumberPagination):
+    """Page-number pagination for listings sorted by anything but the default order, or asked for by page"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
-class OptimizedPagination(PageNumberPagination):
+
+class OptimizedPagination(CursorPagination):
     """
-    Optimized pagination for potentially large file sets.
-    Includes additional metadata about total storage savings.
+    Keyset pagination for potentially large file sets: each page seeks on
+    the ordering from where the previous one ended, so deep pages cost the
+    same as the first. The total count is cached per filter combination
+    until the file table changes, instead of being recounted for every page.
+    
+    A cursor only seeks on the first ordering field and steps over ties with
+    an offset capped at offset_cutoff, so it can't page through low-cardinality
+    orderings (is_duplicate, file_type, size); other orderings than the default
+    one are paged by number instead, as are requests that ask for a page number.
     """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('-uploaded_at', '-id')
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.numbered = None
+        if (OrderedPagination.page_query_param in request.query_params
+                or tuple(self.get_ordering(request, queryset, view)) != self.ordering):
+            self.numbered = OrderedPagination()
+            page = self.numbered.paginate_queryset(queryset, request, view)
+            self.count = self.numbered.page.paginator.count
+            return page
+        
+        page = super().paginate_queryset(queryset, request, view)
+        if page is not None and not self.has_next and not self.has_previous:
+            # The whole result set fits on this page, so it is its own count
+            self.count = len(page)
+        else:
+            self.count = self.get_count(queryset, request)
+        return page
+    
+    def get_count(self, queryset, request):
+        """Return the number of filtered files, from the cache where possible"""
+        # The page position, size and ordering don't change the count
+        params = request.query_params.copy()
+        for param in (self.cursor_query_param, self.page_size_query_param, 'ordering'):
+            params.pop(param, None)
+        
+        # The whole table's count is kept as a running total
+        if not params:
+            return StorageStats.get().total_files
+        
+        cache_key = versioned_key('count', params)
+        count = cache.get(cache_key)
+        if count is None:
+            count = queryset.count()
+            cache.set(cache_key, count, COUNT_TIMEOUT)
+        return count
     
     def get_paginated_response(self, data):
-        # Add storage statistics to pagination response
+        links = self.numbered or self
         return Response({
-            'count': self.page.paginator.count,
-            'next': self.get_next_link(),
-            'previous': self.get_previous_link(),
+            'count': self.count,
+            'next': links.get_next_link(),
+            'previous': links.get_previous_link(),
             'results': data,
         })
 
@@ -85,69 +165,96 @@ class FileViewSet(viewsets.ModelViewSet):
     """
     queryset = File.objects.all()
     serializer_class = FileSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [FileFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = FileFilter
     search_fields = ['original_filename']
     ordering_fields = ['original_filename', 'size', 'uploaded_at', 'file_type', 'is_duplicate']
-    ordering = ['-uploaded_at']
+    ordering = ['-uploaded_at', '-id']
     pagination_class = OptimizedPagination
-    ordering = ['-uploaded_at']
+    # Columns FileSerializer reads (content_hash and storage_saved are derived from them)
+    list_fields = [
+        'id', 'file', 'original_filename', 'file_type', 'size', 'uploaded_at',
+        'content_hash_raw', 'is_duplicate', 'actual_size'
+    ]
+    
     def get_queryset(self):
         """
-        Optimize queryset with select_related for improved performance.
+        Listings only load the columns the serializer reads; other actions
+        get the full queryset.
         """
-        return File.objects.select_related('reference_file').all()
+        if self.action == 'list':
+            return File.objects.only(*self.list_fields)
+        return super().get_queryset()
 
     def create(self, request, *args, **kwargs):
         """
         Enhanced file upload endpoint with content-based deduplication.
         Computes file hash and detects duplicates based on content.
         """
+        file_obj = request.FILES.get('file')
+        if not file_obj:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info(f"File upload initiated: {file_obj.name} ({file_obj.size} bytes, {file_obj.content_type})")
+        
+        # Extract file metadata from the request or use defaults
+        original_filename = request.data.get('original_filename', file_obj.name)
+        file_type = request.data.get('file_type', file_obj.content_type or 'application/octet-stream')
+        file_size = request.data.get('size', file_obj.size)
+        
+        data = {
+            'file': file_obj,
+            'original_filename': original_filename,
+            'file_type': file_type,
+            'size': file_size
+        }
+        
+        # Create and validate the file instance; invalid input is a 400 from DRF
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        
+        # Save with deduplication (handled by the model's save method)
         try:
-            file_obj = request.FILES.get('file')
-            if not file_obj:
-                return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            logger.info(f"File upload initiated: {file_obj.name} ({file_obj.size} bytes, {file_obj.content_type})")
-            
-            # Extract file metadata from the request or use defaults
-            original_filename = request.data.get('original_filename', file_obj.name)
-            file_type = request.data.get('file_type', file_obj.content_type or 'application/octet-stream')
-            file_size = int(request.data.get('size', file_obj.size))
-            
-            data = {
-                'file': file_obj,
-                'original_filename': original_filename,
-                'file_type': file_type,
-                'size': file_size
-            }
-            
-            # Create and validate the file instance
-            serializer = self.get_serializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            
-            # Save with deduplication (handled by the model's save method)
             instance = serializer.save()
+        except IntegrityError as e:
+            logger.error(f"Conflicting file upload: {str(e)}")
+            return Response({'error': f'Upload conflicts with an existing file: {str(e)}'}, status=status.HTTP_409_CONFLICT)
+        
+        # Enhanced response for duplicate files
+        response_data = serializer.data
+        if instance.is_duplicate and instance.reference_file:
+            response_data['duplicate_details'] = {
+                'is_duplicate': True,
+                'original_file_id': str(instance.reference_file.id),
+                'original_filename': instance.reference_file.original_filename,
+                'storage_saved': instance.storage_saved,
+                'content_hash': instance.content_hash
+            }
+            logger.info(f"Duplicate file detected: {instance.original_filename} matches {instance.reference_file.original_filename}")
             
-            # Enhanced response for duplicate files
-            response_data = serializer.data
-            if instance.is_duplicate and instance.reference_file:
-                response_data['duplicate_details'] = {
-                    'is_duplicate': True,
-                    'original_file_id': str(instance.reference_file.id),
-                    'original_filename': instance.reference_file.original_filename,
-                    'storage_saved': instance.storage_saved,
-                    'content_hash': instance.content_hash
-                }
-                logger.info(f"Duplicate file detected: {instance.original_filename} matches {instance.reference_file.original_filename}")
-                
-            headers = self.get_success_headers(serializer.data)
-            return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
-            
-        except Exception as e:
-            logger.error(f"Error during file upload: {str(e)}")
-            return Response({'error': f'Upload failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        headers = self.get_success_headers(serializer.data)
+        return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_upload(self, request):
+        """
+        Upload several files at once (multipart field `files`).
+        They are deduplicated against each other and the stored files
+        in a fixed number of queries.
+        """
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            instances = File.bulk_ingest(uploads)
+        except IntegrityError as e:
+            # A concurrent upload stored some of the same content first; the batch was rolled back
+            logger.error(f"Conflicting bulk upload: {str(e)}")
+            return Response({'error': f'Upload conflicts with an existing file: {str(e)}'}, status=status.HTTP_409_CONFLICT)
+        
+        serializer = self.get_serializer(instances, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
@@ -162,75 +269,93 @@ class FileViewSet(viewsets.ModelViewSet):
             - actual_size: Actual storage used (physical size)
             - storage_saved: Storage space saved through deduplication
             - storage_saved_percentage: Percentage of storage saved
-            - file_types: Count of files by file type
+            - file_types: Count, size and storage saved by file type
             - size_range: Min and max file sizes
             - recent_uploads: Count of files uploaded in last day/week
             - duplicate_trends: How duplication has increased over time
         """
-        try:
-            # Apply any filters from the request
-            queryset = self.filter_queryset(self.get_queryset())
-            
-            # Basic stats
-            total_files = queryset.count()
-            unique_files = queryset.filter(is_duplicate=False).count()
-            duplicate_files = queryset.filter(is_duplicate=True).count()
-            
-            # Storage stats with optimized query
-            storage_stats = queryset.aggregate(
-                total_size=Sum('size'),
-                actual_size=Sum('actual_size'),
-                min_size=Min('size'),
-                max_size=Max('size')
-            )
-            
-            total_size = storage_stats['total_size'] or 0
-            actual_size = storage_stats['actual_size'] or 0
-            storage_saved = total_size - actual_size
-            storage_saved_percentage = round((storage_saved / total_size * 100), 2) if total_size > 0 else 0
-            
-            # Group files by file type with count and total size
-            file_types = queryset.values('file_type').annotate(
-                count=Count('id'),
-                total_type_size=Sum('size')
-            ).order_by('-count')
-            
-            # Recent upload trends
-            now = datetime.now()
-            recent_day = queryset.filter(uploaded_at__gte=now - timedelta(days=1)).count()
-            recent_week = queryset.filter(uploaded_at__gte=now - timedelta(days=7)).count()
-            
-            # Compile all stats
-            stats = {
-                'total_files': total_files,
-                'unique_files': unique_files,
-                'duplicate_files': duplicate_files,
-                'total_size': total_size,
-                'actual_size': actual_size,
-                'storage_saved': storage_saved,
-                'storage_saved_percentage': storage_saved_percentage,
-                'size_range': {
-                    'min': storage_stats['min_size'],
-                    'max': storage_stats['max_size']
-                },
-                'file_types': list(file_types),
-                'recent_uploads': {
-                    'day': recent_day,
-                    'week': recent_week
-                }
-            }
-            
+        # Stats only change when files do, so repeat requests are served from the cache
+        cache_key = versioned_key('stats', request.query_params)
+        stats = cache.get(cache_key)
+        if stats is not None:
             return Response(stats)
-        except Exception as e:
-            logger.error(f"Error calculating stats: {str(e)}")
-            return Response({'error': f'Stats calculation failed: {str(e)}'}, 
-                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # Apply any filters from the request - without parameters there are none
+        queryset = self.filter_queryset(self.get_queryset()) if request.query_params else self.get_queryset()
+        
+        # A single query grouped by file type; filtered totals are summed from its rows
+        now = timezone.now()
+        type_rows = list(queryset.values('file_type').annotate(
+            count=Count('id'),
+            total_type_size=Sum('size'),
+            actual_type_size=Sum('actual_size'),
+            storage_saved=Sum(STORAGE_SAVED),
+            min_size=Min('size'),
+            max_size=Max('size'),
+            unique_files=Count('id', filter=Q(is_duplicate=False)),
+            recent_day=Count('id', filter=Q(uploaded_at__gte=now - timedelta(days=1))),
+            recent_week=Count('id', filter=Q(uploaded_at__gte=now - timedelta(days=7)))
+        ).order_by('-count'))
+        
+        if request.query_params:
+            total_files = sum(row['count'] for row in type_rows)
+            unique_files = sum(row['unique_files'] for row in type_rows)
+            duplicate_files = total_files - unique_files
+            total_size = sum(row['total_type_size'] or 0 for row in type_rows)
+            actual_size = sum(row['actual_type_size'] or 0 for row in type_rows)
+            storage_saved = sum(row['storage_saved'] or 0 for row in type_rows)
+        else:
+            # The whole table's totals are kept as running counters
+            counters = StorageStats.get()
+            total_files, unique_files, duplicate_files = counters.total_files, counters.unique_files, counters.duplicate_files
+            total_size, actual_size, storage_saved = counters.total_size, counters.actual_size, counters.bytes_saved
+        storage_saved_percentage = round((storage_saved / total_size * 100), 2) if total_size > 0 else 0
+        
+        # Count, total size and storage saved per file type
+        file_types = [
+            {
+                'file_type': row['file_type'],
+                'count': row['count'],
+                'total_type_size': row['total_type_size'],
+                'storage_saved': row['storage_saved']
+            }
+            for row in type_rows
+        ]
+        
+        # Compile all stats
+        stats = {
+            'total_files': total_files,
+            'unique_files': unique_files,
+            'duplicate_files': duplicate_files,
+            'total_size': total_size,
+            'actual_size': actual_size,
+            'storage_saved': storage_saved,
+            'storage_saved_percentage': storage_saved_percentage,
+            'size_range': {
+                'min': min((row['min_size'] for row in type_rows), default=None),
+                'max': max((row['max_size'] for row in type_rows), default=None)
+            },
+            'file_types': file_types,
+            'recent_uploads': {
+                'day': sum(row['recent_day'] for row in type_rows),
+                'week': sum(row['recent_week'] for row in type_rows)
+            }
+        }
+        
+        cache.set(cache_key, stats, STATS_TIMEOUT)
+        return Response(stats)
     
     @action(detail=False, methods=['get'])
     def file_types(self, request):
         """
         Get a list of all file types in the system.
-        Used for populating filter dropdown in the frontend.
+        Used for populating filter dropdown in the frontend, so it is cached
+        until the file table changes.
         """
-        file_types = File.objects.values_list('file_type', flat=True).distinct()
-        return Response(list(file_types))
+        cache_key = versioned_key('file_types')
+        file_types = cache.get(cache_key)
+        if file_types is None:
+            # Without the default ordering, DISTINCT applies to file_type alone
+            file_types = list(File.objects.order_by('file_type').values_list('file_type', flat=True).distinct())
+            cache.set(cache_key, file_types, FILE_TYPES_TIMEOUT)
+        return Response(file_types)